@@ -250,6 +250,9 @@ MFA_USER_ID = "mfa_user_id"
 FLASK_PROFILER_PATH = os.environ.get("FLASK_PROFILER_PATH")
 FLASK_PROFILER_PASSWORD = os.environ.get("FLASK_PROFILER_PASSWORD")
 
+# reload the templates when they change, this is already enabled in debug mode
+TEMPLATES_AUTO_RELOAD = "TEMPLATES_AUTO_RELOAD" in os.environ
+
 # Job names
 JOB_ONBOARDING_1 = "onboarding-1"
 JOB_ONBOARDING_2 = "onboarding-2"
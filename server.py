@@ -1,11 +1,12 @@
 import json
+import logging
 import os
 import time
-from datetime import timedelta
+from datetime import date, timedelta
+from functools import partial
+from typing import Optional
 
 import arrow
-import flask_profiler
-import sentry_sdk
 from coinbase_commerce.error import WebhookInvalidPayload, SignatureVerificationError
 from coinbase_commerce.webhook import Webhook
 from flask import (
@@ -18,29 +19,14 @@ from flask import (
     flash,
     session,
     g,
+    has_request_context,
 )
-from flask_admin import Admin
-from flask_cors import cross_origin, CORS
+from flask_cors import CORS
 from flask_login import current_user
-from sentry_sdk.integrations.flask import FlaskIntegration
-from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
+from sqlalchemy import insert
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 from app import paddle_utils, s3, config
-from app.admin_model import (
-    SLAdminIndexView,
-    UserAdmin,
-    EmailLogAdmin,
-    AliasAdmin,
-    MailboxAdmin,
-    LifetimeCouponAdmin,
-    ManualSubscriptionAdmin,
-    ClientAdmin,
-    ReferralAdmin,
-    PayoutAdmin,
-    CouponAdmin,
-    CustomDomainAdmin,
-)
 from app.api.base import api_bp
 from app.auth.base import auth_bp
 from app.config import (
@@ -70,6 +56,7 @@ from app.config import (
     COINBASE_WEBHOOK_SECRET,
     ROOT_DIR,
     PAGE_LIMIT,
+    TEMPLATES_AUTO_RELOAD,
 )
 from app.dashboard.base import dashboard_bp
 from app.db import Session
@@ -110,8 +97,13 @@ from app.models import (
 from app.monitor.base import monitor_bp
 from app.oauth.base import oauth_bp
 from app.pgp_utils import load_public_key
+from app.utils import random_string
 
 if SENTRY_DSN:
+    import sentry_sdk
+    from sentry_sdk.integrations.flask import FlaskIntegration
+    from sentry_sdk.integrations.sqlalchemy import SqlalchemyIntegration
+
     LOG.d("enable sentry")
     sentry_sdk.init(
         dsn=SENTRY_DSN,
@@ -126,6 +118,21 @@ if SENTRY_DSN:
 os.environ["OAUTHLIB_INSECURE_TRANSPORT"] = "1"
 
 
+class OAuthPathAliasMiddleware:
+    """The OAuth endpoints are served under /oauth2, keep /oauth as an alias:
+    rewrite /oauth/* to /oauth2/* instead of registering oauth_bp twice"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path.startswith("/oauth/"):
+            environ["PATH_INFO"] = "/oauth2" + path[len("/oauth") :]
+
+        return self.wsgi_app(environ, start_response)
+
+
 def create_light_app() -> Flask:
     app = Flask(__name__)
     app.config["SQLALCHEMY_DATABASE_URI"] = DB_URI
@@ -142,6 +149,7 @@ def create_app() -> Flask:
     app = Flask(__name__)
     # SimpleLogin is deployed behind NGINX
     app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_host=1)
+    app.wsgi_app = OAuthPathAliasMiddleware(app.wsgi_app)
     limiter.init_app(app)
 
     app.url_map.strict_slashes = False
@@ -153,7 +161,9 @@ def create_app() -> Flask:
 
     app.secret_key = FLASK_SECRET
 
-    app.config["TEMPLATES_AUTO_RELOAD"] = True
+    # when not set, Flask only reloads the templates in debug mode
+    if TEMPLATES_AUTO_RELOAD:
+        app.config["TEMPLATES_AUTO_RELOAD"] = True
 
     # to have a "fluid" layout for admin
     app.config["FLASK_ADMIN_FLUID_LAYOUT"] = True
@@ -163,6 +173,8 @@ def create_app() -> Flask:
     if URL.startswith("https"):
         app.config["SESSION_COOKIE_SECURE"] = True
     app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
+    # the session cookie is valid for 7 days
+    app.permanent_session_lifetime = timedelta(days=7)
 
     setup_error_page(app)
 
@@ -181,6 +193,8 @@ def create_app() -> Flask:
     register_custom_commands(app)
 
     if FLASK_PROFILER_PATH:
+        import flask_profiler
+
         LOG.d("Enable flask-profiler")
         app.config["flask_profiler"] = {
             "enabled": True,
@@ -194,15 +208,20 @@ def create_app() -> Flask:
         }
         flask_profiler.init_app(app)
 
-    # enable CORS on /api endpoints
-    CORS(app, resources={r"/api/*": {"origins": "*"}})
+    # enable CORS on /api and the OpenID metadata endpoints
+    CORS(
+        app,
+        resources={
+            r"/api/*": {"origins": "*"},
+            r"/.well-known/*": {"origins": "*"},
+            r"/jwks": {"origins": "*"},
+        },
+    )
 
     # set session to permanent so user stays signed in after quitting the browser
-    # the cookie is valid for 7 days
     @app.before_request
     def make_session_permanent():
         session.permanent = True
-        app.permanent_session_lifetime = timedelta(days=7)
 
     @app.teardown_appcontext
     def cleanup(resp_or_exc):
@@ -214,6 +233,9 @@ def create_app() -> Flask:
 def fake_data():
     LOG.d("create fake data")
 
+    # all the fake data is created in one transaction, committed at the end.
+    # Session.flush() is only used when the id of a new object is needed.
+
     # Create a user
     user = User.create(
         email="john@wick.com",
@@ -227,7 +249,6 @@ def fake_data():
         fido_uuid=None,
     )
     user.trial_end = None
-    Session.commit()
 
     # add a profile picture
     file_path = "profile_pic.svg"
@@ -236,13 +257,12 @@ def fake_data():
         open(os.path.join(ROOT_DIR, "static", "default-icon.svg"), "rb"),
         content_type="image/svg",
     )
-    file = File.create(user_id=user.id, path=file_path, commit=True)
+    file = File.create(user_id=user.id, path=file_path, flush=True)
     user.profile_picture_id = file.id
-    Session.commit()
 
     # create a bounced email
     alias = Alias.create_new_random(user)
-    Session.commit()
+    Session.flush()
 
     bounce_email_file_path = "bounce.eml"
     s3.upload_email_from_bytesio(
@@ -254,7 +274,7 @@ def fake_data():
         path=bounce_email_file_path,
         full_report_path=bounce_email_file_path,
         user_id=user.id,
-        commit=True,
+        flush=True,
     )
 
     contact = Contact.create(
@@ -262,7 +282,7 @@ def fake_data():
         alias_id=alias.id,
         website_email="hey@google.com",
         reply_email="rep@sl.local",
-        commit=True,
+        flush=True,
     )
     EmailLog.create(
         user_id=user.id,
@@ -270,11 +290,10 @@ def fake_data():
         alias_id=contact.alias_id,
         refused_email_id=refused_email.id,
         bounced=True,
-        commit=True,
     )
 
-    LifetimeCoupon.create(code="lifetime-coupon", nb_used=10, commit=True)
-    Coupon.create(code="coupon", commit=True)
+    LifetimeCoupon.create(code="lifetime-coupon", nb_used=10)
+    Coupon.create(code="coupon")
 
     # Create a subscription for user
     Subscription.create(
@@ -285,12 +304,9 @@ def fake_data():
         event_time=arrow.now(),
         next_bill_date=arrow.now().shift(days=10).date(),
         plan=PlanEnum.monthly,
-        commit=True,
     )
 
-    CoinbaseSubscription.create(
-        user_id=user.id, end_at=arrow.now().shift(days=10), commit=True
-    )
+    CoinbaseSubscription.create(user_id=user.id, end_at=arrow.now().shift(days=10))
 
     api_key = ApiKey.create(user_id=user.id, name="Chrome")
     api_key.code = "code"
@@ -304,60 +320,57 @@ def fake_data():
         email="pgp@example.org",
         verified=True,
         pgp_public_key=pgp_public_key,
+        flush=True,
     )
     m1.pgp_finger_print = load_public_key(pgp_public_key)
-    Session.commit()
 
     # example@example.com is in a LOT of data breaches
     Alias.create(email="example@example.com", user_id=user.id, mailbox_id=m1.id)
 
-    for i in range(3):
-        if i % 2 == 0:
-            a = Alias.create(
-                email=f"e{i}@{FIRST_ALIAS_DOMAIN}", user_id=user.id, mailbox_id=m1.id
-            )
-        else:
-            a = Alias.create(
-                email=f"e{i}@{FIRST_ALIAS_DOMAIN}",
-                user_id=user.id,
-                mailbox_id=user.default_mailbox_id,
-            )
-        Session.commit()
-
-        if i % 5 == 0:
-            if i % 2 == 0:
-                AliasMailbox.create(alias_id=a.id, mailbox_id=user.default_mailbox_id)
-            else:
-                AliasMailbox.create(alias_id=a.id, mailbox_id=m1.id)
-        Session.commit()
-
-        # some aliases don't have any activity
-        # if i % 3 != 0:
-        #     contact = Contact.create(
-        #         user_id=user.id,
-        #         alias_id=a.id,
-        #         website_email=f"contact{i}@example.com",
-        #         reply_email=f"rep{i}@sl.local",
-        #     )
-        #     Session.commit()
-        #     for _ in range(3):
-        #         EmailLog.create(user_id=user.id, contact_id=contact.id, alias_id=contact.alias_id)
-        #         Session.commit()
-
-        # have some disabled alias
-        if i % 5 == 0:
-            a.enabled = False
-            Session.commit()
+    # insert the aliases in bulk, some of them are disabled
+    alias_rows = [
+        dict(
+            email=f"e{i}@{FIRST_ALIAS_DOMAIN}",
+            user_id=user.id,
+            mailbox_id=m1.id if i % 2 == 0 else user.default_mailbox_id,
+            enabled=i % 5 != 0,
+        )
+        for i in range(3)
+    ]
+    # a single multi-row INSERT ... RETURNING to get back all the alias ids.
+    # RETURNING doesn't necessarily follow the VALUES order: match the ids by email
+    result = Session.execute(
+        insert(Alias).values(alias_rows).returning(Alias.id, Alias.email)
+    )
+    alias_id_by_email = {email: alias_id for alias_id, email in result}
+
+    Session.execute(
+        insert(AliasMailbox).values(
+            [
+                dict(
+                    alias_id=alias_id_by_email[row["email"]],
+                    mailbox_id=user.default_mailbox_id if i % 2 == 0 else m1.id,
+                )
+                for i, row in enumerate(alias_rows)
+                if i % 5 == 0
+            ]
+        )
+    )
 
-    custom_domain1 = CustomDomain.create(user_id=user.id, domain="ab.cd", verified=True)
-    Session.commit()
+    # set ownership_txt_token so CustomDomain.create() doesn't commit
+    custom_domain1 = CustomDomain.create(
+        user_id=user.id,
+        domain="ab.cd",
+        verified=True,
+        ownership_txt_token=random_string(30),
+        flush=True,
+    )
 
     Alias.create(
         user_id=user.id,
         email="first@ab.cd",
         mailbox_id=user.default_mailbox_id,
         custom_domain_id=custom_domain1.id,
-        commit=True,
     )
 
     Alias.create(
@@ -365,18 +378,16 @@ def fake_data():
         email="second@ab.cd",
         mailbox_id=user.default_mailbox_id,
         custom_domain_id=custom_domain1.id,
-        commit=True,
     )
 
     Directory.create(user_id=user.id, name="abcd")
     Directory.create(user_id=user.id, name="xyzt")
-    Session.commit()
 
     # Create a client
     client1 = Client.create_new(name="Demo", user_id=user.id)
     client1.oauth_client_id = "client-id"
     client1.oauth_client_secret = "client-secret"
-    Session.commit()
+    Session.flush()
 
     RedirectUri.create(
         client_id=client1.id, uri="https://your-website.com/oauth-callback"
@@ -385,11 +396,12 @@ def fake_data():
     client2 = Client.create_new(name="Demo 2", user_id=user.id)
     client2.oauth_client_id = "client-id2"
     client2.oauth_client_secret = "client-secret2"
-    Session.commit()
 
     ClientUser.create(user_id=user.id, client_id=client1.id, name="Fake Name")
 
-    referral = Referral.create(user_id=user.id, code="Website", name="First referral")
+    referral = Referral.create(
+        user_id=user.id, code="Website", name="First referral", flush=True
+    )
     Referral.create(user_id=user.id, code="Podcast", name="First referral")
     Payout.create(
         user_id=user.id, amount=1000, number_upgraded_account=100, payment_method="BTC"
@@ -400,11 +412,14 @@ def fake_data():
         number_upgraded_account=200,
         payment_method="PayPal",
     )
-    Session.commit()
 
-    for i in range(6):
-        Notification.create(user_id=user.id, message=f"""Hey hey <b>{i}</b> """ * 10)
-    Session.commit()
+    Session.execute(
+        insert(Notification),
+        [
+            dict(user_id=user.id, message=f"""Hey hey <b>{i}</b> """ * 10)
+            for i in range(6)
+        ],
+    )
 
     user2 = User.create(
         email="winston@continental.com",
@@ -413,37 +428,38 @@ def fake_data():
         referral_id=referral.id,
     )
     Mailbox.create(user_id=user2.id, email="winston2@high.table", verified=True)
-    Session.commit()
 
     ManualSubscription.create(
         user_id=user2.id,
         end_at=arrow.now().shift(years=1, days=1),
         comment="Local manual",
-        commit=True,
     )
 
-    SLDomain.create(domain="premium.com", premium_only=True, commit=True)
+    SLDomain.create(domain="premium.com", premium_only=True)
 
-    hibp1 = Hibp.create(
-        name="first breach", description="breach description", commit=True
-    )
-    hibp2 = Hibp.create(
-        name="second breach", description="breach description", commit=True
-    )
+    hibp1 = Hibp.create(name="first breach", description="breach description")
+    hibp2 = Hibp.create(name="second breach", description="breach description")
     breached_alias1 = Alias.create(
-        email="john@example.com", user_id=user.id, mailbox_id=m1.id, commit=True
+        email="john@example.com", user_id=user.id, mailbox_id=m1.id
     )
     breached_alias2 = Alias.create(
-        email="wick@example.com", user_id=user.id, mailbox_id=m1.id, commit=True
+        email="wick@example.com", user_id=user.id, mailbox_id=m1.id
     )
+    Session.flush()
     AliasHibp.create(hibp_id=hibp1.id, alias_id=breached_alias1.id)
     AliasHibp.create(hibp_id=hibp2.id, alias_id=breached_alias2.id)
 
     # old domain will have ownership_verified=True
     CustomDomain.create(
-        user_id=user.id, domain="old.com", verified=True, ownership_verified=True
+        user_id=user.id,
+        domain="old.com",
+        verified=True,
+        ownership_verified=True,
+        ownership_txt_token=random_string(30),
     )
 
+    Session.commit()
+
 
 @login_manager.user_loader
 def load_user(alternative_id):
@@ -460,13 +476,17 @@ def register_blueprints(app: Flask):
     app.register_blueprint(dashboard_bp)
     app.register_blueprint(developer_bp)
 
-    app.register_blueprint(oauth_bp, url_prefix="/oauth")
+    # /oauth/* is also handled by OAuthPathAliasMiddleware
     app.register_blueprint(oauth_bp, url_prefix="/oauth2")
 
     app.register_blueprint(discover_bp)
     app.register_blueprint(api_bp)
 
 
+# requests whose path starts with one of these prefixes are not logged
+_NOT_LOGGED_PATHS = ("/static", "/admin/static", "/_debug_toolbar")
+
+
 def set_index_page(app):
     @app.route("/", methods=["GET", "POST"])
     def index():
@@ -478,11 +498,7 @@ def set_index_page(app):
     @app.before_request
     def before_request():
         # not logging /static call
-        if (
-            not request.path.startswith("/static")
-            and not request.path.startswith("/admin/static")
-            and not request.path.startswith("/_debug_toolbar")
-        ):
+        if not request.path.startswith(_NOT_LOGGED_PATHS):
             g.start_time = time.time()
 
             # to handle the referral url that has ?slref=code part
@@ -493,16 +509,13 @@ def set_index_page(app):
     @app.after_request
     def after_request(res):
         # not logging /static call
-        if (
-            not request.path.startswith("/static")
-            and not request.path.startswith("/admin/static")
-            and not request.path.startswith("/_debug_toolbar")
-        ):
+        path = request.path
+        if LOG.isEnabledFor(logging.DEBUG) and not path.startswith(_NOT_LOGGED_PATHS):
             LOG.d(
                 "%s %s %s %s %s, takes %s",
                 request.remote_addr,
                 request.method,
-                request.path,
+                path,
                 request.args,
                 res.status_code,
                 time.time() - g.start_time,
@@ -512,10 +525,9 @@ def set_index_page(app):
 
 
 def setup_openid_metadata(app):
-    @app.route("/.well-known/openid-configuration")
-    @cross_origin()
-    def openid_config():
-        res = {
+    # both responses are static: serialize them once when the routes are registered
+    openid_config_res = json.dumps(
+        {
             "issuer": URL,
             "authorization_endpoint": URL + "/oauth2/authorize",
             "token_endpoint": URL + "/oauth2/token",
@@ -534,14 +546,16 @@ def setup_openid_metadata(app):
             # "introspection_endpoint": URL + "/oauth2/token/introspection",
             # "revocation_endpoint": URL + "/oauth2/token/revocation",
         }
+    ).encode()
+    jwks_res = json.dumps({"keys": [get_jwk_key()]}).encode()
 
-        return jsonify(res)
+    @app.route("/.well-known/openid-configuration")
+    def openid_config():
+        return app.response_class(openid_config_res, mimetype="application/json")
 
     @app.route("/jwks")
-    @cross_origin()
     def jwks():
-        res = {"keys": [get_jwk_key()]}
-        return jsonify(res)
+        return app.response_class(jwks_res, mimetype="application/json")
 
 
 def get_current_user():
@@ -551,62 +565,43 @@ def get_current_user():
         return current_user
 
 
+# error returned for /api/ endpoints, by status code
+_API_ERRORS = {
+    400: "Bad Request",
+    401: "Unauthorized",
+    403: "Forbidden",
+    404: "No such endpoint",
+    405: "Method not allowed",
+    429: "Rate limit exceeded",
+    500: "Internal error",
+}
+
+
 def setup_error_page(app):
-    @app.errorhandler(400)
-    def bad_request(e):
-        if request.path.startswith("/api/"):
-            return jsonify(error="Bad Request"), 400
-        else:
-            return render_template("error/400.html"), 400
+    def error_page(e, code):
+        if code == 429:
+            LOG.w(
+                "Client hit rate limit on path %s, user:%s",
+                request.path,
+                get_current_user(),
+            )
+        elif code == 500:
+            LOG.e(e)
 
-    @app.errorhandler(401)
-    def unauthorized(e):
         if request.path.startswith("/api/"):
-            return jsonify(error="Unauthorized"), 401
-        else:
+            return jsonify(error=_API_ERRORS[code]), code
+
+        if code == 401:
             flash("You need to login to see this page", "error")
             return redirect(url_for("auth.login", next=request.full_path))
 
-    @app.errorhandler(403)
-    def forbidden(e):
-        if request.path.startswith("/api/"):
-            return jsonify(error="Forbidden"), 403
-        else:
-            return render_template("error/403.html"), 403
-
-    @app.errorhandler(429)
-    def rate_limited(e):
-        LOG.w(
-            "Client hit rate limit on path %s, user:%s",
-            request.path,
-            get_current_user(),
-        )
-        if request.path.startswith("/api/"):
-            return jsonify(error="Rate limit exceeded"), 429
-        else:
-            return render_template("error/429.html"), 429
-
-    @app.errorhandler(404)
-    def page_not_found(e):
-        if request.path.startswith("/api/"):
-            return jsonify(error="No such endpoint"), 404
-        else:
-            return render_template("error/404.html"), 404
+        return render_template(f"error/{code}.html"), code
 
-    @app.errorhandler(405)
-    def wrong_method(e):
-        if request.path.startswith("/api/"):
-            return jsonify(error="Method not allowed"), 405
-        else:
-            return render_template("error/405.html"), 405
-
-    @app.errorhandler(Exception)
-    def error_handler(e):
-        LOG.e(e)
-        if request.path.startswith("/api/"):
-            return jsonify(error="Internal error"), 500
-        else:
-            return render_template("error/500.html"), 500
+    for code in _API_ERRORS:
+        # any unhandled exception is an internal error
+        app.register_error_handler(
+            Exception if code == 500 else code, partial(error_page, code=code)
+        )
 
 
 def setup_favicon_route(app):
@@ -617,180 +612,222 @@ def setup_favicon_route(app):
 
 def jinja2_filter(app):
     def format_datetime(value):
-        dt = arrow.get(value)
-        return dt.humanize()
+        # most values are already Arrow objects coming from ArrowType columns
+        dt = value if isinstance(value, arrow.Arrow) else arrow.get(value)
+
+        if not has_request_context():
+            return dt.humanize()
+
+        # humanize all the dates of a page relatively to the same "now".
+        # It's stored on the request: flask.g lives as long as the app context,
+        # which can span several requests
+        now = getattr(request, "humanize_now", None)
+        if now is None:
+            now = request.humanize_now = arrow.now()
+
+        return dt.humanize(now)
 
     app.jinja_env.filters["dt"] = format_datetime
 
+    # the template variables that don't depend on the request
+    static_context = dict(
+        URL=URL,
+        SENTRY_DSN=SENTRY_FRONT_END_DSN,
+        VERSION=SHA1,
+        FIRST_ALIAS_DOMAIN=FIRST_ALIAS_DOMAIN,
+        PLAUSIBLE_HOST=PLAUSIBLE_HOST,
+        PLAUSIBLE_DOMAIN=PLAUSIBLE_DOMAIN,
+        GITHUB_CLIENT_ID=GITHUB_CLIENT_ID,
+        GOOGLE_CLIENT_ID=GOOGLE_CLIENT_ID,
+        FACEBOOK_CLIENT_ID=FACEBOOK_CLIENT_ID,
+        LANDING_PAGE_URL=LANDING_PAGE_URL,
+        STATUS_PAGE_URL=STATUS_PAGE_URL,
+        SUPPORT_EMAIL=SUPPORT_EMAIL,
+        PGP_SIGNER=PGP_SIGNER,
+        PAGE_LIMIT=PAGE_LIMIT,
+    )
+
     @app.context_processor
     def inject_stage_and_region():
         return dict(
-            YEAR=arrow.now().year,
-            URL=URL,
-            SENTRY_DSN=SENTRY_FRONT_END_DSN,
-            VERSION=SHA1,
-            FIRST_ALIAS_DOMAIN=FIRST_ALIAS_DOMAIN,
-            PLAUSIBLE_HOST=PLAUSIBLE_HOST,
-            PLAUSIBLE_DOMAIN=PLAUSIBLE_DOMAIN,
-            GITHUB_CLIENT_ID=GITHUB_CLIENT_ID,
-            GOOGLE_CLIENT_ID=GOOGLE_CLIENT_ID,
-            FACEBOOK_CLIENT_ID=FACEBOOK_CLIENT_ID,
-            LANDING_PAGE_URL=LANDING_PAGE_URL,
-            STATUS_PAGE_URL=STATUS_PAGE_URL,
-            SUPPORT_EMAIL=SUPPORT_EMAIL,
-            PGP_SIGNER=PGP_SIGNER,
+            static_context,
+            YEAR=date.today().year,
             CANONICAL_URL=f"{URL}{request.path}",
-            PAGE_LIMIT=PAGE_LIMIT,
         )
 
 
-def setup_paddle_callback(app: Flask):
-    @app.route("/paddle", methods=["GET", "POST"])
-    def paddle():
-        LOG.d(f"paddle callback {request.form.get('alert_name')} {request.form}")
+def _parse_next_bill_date(form):
+    return arrow.get(form.get("next_bill_date"), "YYYY-MM-DD").date()
 
-        # make sure the request comes from Paddle
-        if not paddle_utils.verify_incoming_request(dict(request.form)):
-            LOG.e("request not coming from paddle. Request data:%s", dict(request.form))
-            return "KO", 400
 
-        if (
-            request.form.get("alert_name") == "subscription_created"
-        ):  # new user subscribes
-            # the passthrough is json encoded, e.g.
-            # request.form.get("passthrough") = '{"user_id": 88 }'
-            passthrough = json.loads(request.form.get("passthrough"))
-            user_id = passthrough.get("user_id")
-            user = User.get(user_id)
-
-            subscription_plan_id = int(request.form.get("subscription_plan_id"))
-
-            if subscription_plan_id in PADDLE_MONTHLY_PRODUCT_IDS:
-                plan = PlanEnum.monthly
-            elif subscription_plan_id in PADDLE_YEARLY_PRODUCT_IDS:
-                plan = PlanEnum.yearly
-            else:
-                LOG.e(
-                    "Unknown subscription_plan_id %s %s",
-                    subscription_plan_id,
-                    request.form,
-                )
-                return "No such subscription", 400
-
-            sub = Subscription.get_by(user_id=user.id)
-
-            if not sub:
-                LOG.d(f"create a new Subscription for user {user}")
-                Subscription.create(
-                    user_id=user.id,
-                    cancel_url=request.form.get("cancel_url"),
-                    update_url=request.form.get("update_url"),
-                    subscription_id=request.form.get("subscription_id"),
-                    event_time=arrow.now(),
-                    next_bill_date=arrow.get(
-                        request.form.get("next_bill_date"), "YYYY-MM-DD"
-                    ).date(),
-                    plan=plan,
-                )
-            else:
-                LOG.d(f"Update an existing Subscription for user {user}")
-                sub.cancel_url = request.form.get("cancel_url")
-                sub.update_url = request.form.get("update_url")
-                sub.subscription_id = request.form.get("subscription_id")
-                sub.event_time = arrow.now()
-                sub.next_bill_date = arrow.get(
-                    request.form.get("next_bill_date"), "YYYY-MM-DD"
-                ).date()
-                sub.plan = plan
-
-                # make sure to set the new plan as not-cancelled
-                # in case user cancels a plan and subscribes a new plan
-                sub.cancelled = False
-
-            LOG.d("User %s upgrades!", user)
+def _parse_plan(form) -> Optional[PlanEnum]:
+    subscription_plan_id = int(form.get("subscription_plan_id"))
 
-            Session.commit()
+    if subscription_plan_id in PADDLE_MONTHLY_PRODUCT_IDS:
+        return PlanEnum.monthly
+    elif subscription_plan_id in PADDLE_YEARLY_PRODUCT_IDS:
+        return PlanEnum.yearly
 
-        elif request.form.get("alert_name") == "subscription_payment_succeeded":
-            subscription_id = request.form.get("subscription_id")
-            LOG.d("Update subscription %s", subscription_id)
-
-            sub: Subscription = Subscription.get_by(subscription_id=subscription_id)
-            # when user subscribes, the "subscription_payment_succeeded" can arrive BEFORE "subscription_created"
-            # at that time, subscription object does not exist yet
-            if sub:
-                sub.event_time = arrow.now()
-                sub.next_bill_date = arrow.get(
-                    request.form.get("next_bill_date"), "YYYY-MM-DD"
-                ).date()
-
-                Session.commit()
-
-        elif request.form.get("alert_name") == "subscription_cancelled":
-            subscription_id = request.form.get("subscription_id")
-
-            sub: Subscription = Subscription.get_by(subscription_id=subscription_id)
-            if sub:
-                # cancellation_effective_date should be the same as next_bill_date
-                LOG.w(
-                    "Cancel subscription %s %s on %s, next bill date %s",
-                    subscription_id,
-                    sub.user,
-                    request.form.get("cancellation_effective_date"),
-                    sub.next_bill_date,
-                )
-                sub.event_time = arrow.now()
+    return None
 
-                sub.cancelled = True
-                Session.commit()
 
-                user = sub.user
+def _handle_subscription_created(form):
+    """new user subscribes"""
+    # the passthrough is json encoded, e.g.
+    # form.get("passthrough") = '{"user_id": 88 }'
+    passthrough = json.loads(form.get("passthrough"))
+    user_id = passthrough.get("user_id")
+    user = User.get(user_id)
 
-                send_email(
-                    user.email,
-                    "SimpleLogin - what can we do to improve the product?",
-                    render(
-                        "transactional/subscription-cancel.txt",
-                        end_date=request.form.get("cancellation_effective_date"),
-                    ),
-                )
+    plan = _parse_plan(form)
+    if plan is None:
+        LOG.e(
+            "Unknown subscription_plan_id %s %s",
+            form.get("subscription_plan_id"),
+            form,
+        )
+        return "No such subscription", 400
+
+    sub = Subscription.get_by(user_id=user.id)
+
+    if not sub:
+        LOG.d(f"create a new Subscription for user {user}")
+        Subscription.create(
+            user_id=user.id,
+            cancel_url=form.get("cancel_url"),
+            update_url=form.get("update_url"),
+            subscription_id=form.get("subscription_id"),
+            event_time=arrow.now(),
+            next_bill_date=_parse_next_bill_date(form),
+            plan=plan,
+        )
+    else:
+        LOG.d(f"Update an existing Subscription for user {user}")
+        sub.cancel_url = form.get("cancel_url")
+        sub.update_url = form.get("update_url")
+        sub.subscription_id = form.get("subscription_id")
+        sub.event_time = arrow.now()
+        sub.next_bill_date = _parse_next_bill_date(form)
+        sub.plan = plan
+
+        # make sure to set the new plan as not-cancelled
+        # in case user cancels a plan and subscribes a new plan
+        sub.cancelled = False
+
+    LOG.d("User %s upgrades!", user)
+
+    Session.commit()
+    return "OK"
+
+
+def _handle_subscription_payment_succeeded(form):
+    subscription_id = form.get("subscription_id")
+    LOG.d("Update subscription %s", subscription_id)
+
+    sub: Subscription = Subscription.get_by(subscription_id=subscription_id)
+    # when user subscribes, the "subscription_payment_succeeded" can arrive BEFORE "subscription_created"
+    # at that time, subscription object does not exist yet
+    if sub:
+        sub.event_time = arrow.now()
+        sub.next_bill_date = _parse_next_bill_date(form)
+
+        Session.commit()
+
+    return "OK"
+
+
+def _handle_subscription_cancelled(form):
+    subscription_id = form.get("subscription_id")
+
+    sub: Subscription = Subscription.get_by(subscription_id=subscription_id)
+    if not sub:
+        return "No such subscription", 400
+
+    # cancellation_effective_date should be the same as next_bill_date
+    LOG.w(
+        "Cancel subscription %s %s on %s, next bill date %s",
+        subscription_id,
+        sub.user,
+        form.get("cancellation_effective_date"),
+        sub.next_bill_date,
+    )
+    sub.event_time = arrow.now()
+
+    sub.cancelled = True
+    Session.commit()
+
+    user = sub.user
+
+    send_email(
+        user.email,
+        "SimpleLogin - what can we do to improve the product?",
+        render(
+            "transactional/subscription-cancel.txt",
+            end_date=form.get("cancellation_effective_date"),
+        ),
+    )
+
+    return "OK"
+
+
+def _handle_subscription_updated(form):
+    subscription_id = form.get("subscription_id")
+
+    sub: Subscription = Subscription.get_by(subscription_id=subscription_id)
+    if not sub:
+        return "No such subscription", 400
+
+    LOG.d(
+        "Update subscription %s %s on %s, next bill date %s",
+        subscription_id,
+        sub.user,
+        form.get("cancellation_effective_date"),
+        sub.next_bill_date,
+    )
+    if int(form.get("subscription_plan_id")) == PADDLE_MONTHLY_PRODUCT_ID:
+        plan = PlanEnum.monthly
+    else:
+        plan = PlanEnum.yearly
+
+    sub.cancel_url = form.get("cancel_url")
+    sub.update_url = form.get("update_url")
+    sub.event_time = arrow.now()
+    sub.next_bill_date = _parse_next_bill_date(form)
+    sub.plan = plan
+
+    # make sure to set the new plan as not-cancelled
+    sub.cancelled = False
+
+    Session.commit()
+    return "OK"
+
+
+# Paddle alert_name -> handler
+PADDLE_HANDLERS = {
+    "subscription_created": _handle_subscription_created,
+    "subscription_payment_succeeded": _handle_subscription_payment_succeeded,
+    "subscription_cancelled": _handle_subscription_cancelled,
+    "subscription_updated": _handle_subscription_updated,
+}
+
+
+def setup_paddle_callback(app: Flask):
+    @app.route("/paddle", methods=["GET", "POST"])
+    def paddle():
+        form = request.form
+        form_dict = form.to_dict()
+        alert_name = form.get("alert_name")
+        LOG.d(f"paddle callback {alert_name} {form}")
+
+        # make sure the request comes from Paddle
+        if not paddle_utils.verify_incoming_request(form_dict):
+            LOG.e("request not coming from paddle. Request data:%s", form_dict)
+            return "KO", 400
+
+        handler = PADDLE_HANDLERS.get(alert_name)
+        if handler:
+            return handler(form)
 
-            else:
-                return "No such subscription", 400
-        elif request.form.get("alert_name") == "subscription_updated":
-            subscription_id = request.form.get("subscription_id")
-
-            sub: Subscription = Subscription.get_by(subscription_id=subscription_id)
-            if sub:
-                LOG.d(
-                    "Update subscription %s %s on %s, next bill date %s",
-                    subscription_id,
-                    sub.user,
-                    request.form.get("cancellation_effective_date"),
-                    sub.next_bill_date,
-                )
-                if (
-                    int(request.form.get("subscription_plan_id"))
-                    == PADDLE_MONTHLY_PRODUCT_ID
-                ):
-                    plan = PlanEnum.monthly
-                else:
-                    plan = PlanEnum.yearly
-
-                sub.cancel_url = request.form.get("cancel_url")
-                sub.update_url = request.form.get("update_url")
-                sub.event_time = arrow.now()
-                sub.next_bill_date = arrow.get(
-                    request.form.get("next_bill_date"), "YYYY-MM-DD"
-                ).date()
-                sub.plan = plan
-
-                # make sure to set the new plan as not-cancelled
-                sub.cancelled = False
-
-                Session.commit()
-            else:
-                return "No such subscription", 400
         return "OK"
 
 
@@ -885,6 +922,24 @@ def init_extensions(app: Flask):
 
 
 def init_admin(app):
+    # only needed by the web app, not by the scripts using create_light_app()
+    from flask_admin import Admin
+
+    from app.admin_model import (
+        SLAdminIndexView,
+        UserAdmin,
+        EmailLogAdmin,
+        AliasAdmin,
+        MailboxAdmin,
+        LifetimeCouponAdmin,
+        ManualSubscriptionAdmin,
+        ClientAdmin,
+        ReferralAdmin,
+        PayoutAdmin,
+        CouponAdmin,
+        CustomDomainAdmin,
+    )
+
     admin = Admin(name="SimpleLogin", template_mode="bootstrap4")
 
     admin.init_app(app, index_view=SLAdminIndexView())
@@ -1,8 +1,18 @@
 import arrow
+from flask import request
+from werkzeug.datastructures import MultiDict
 
+from app import paddle_utils
+from app.config import PADDLE_MONTHLY_PRODUCT_ID, PADDLE_YEARLY_PRODUCT_ID
 from app.db import Session
-from app.models import User, CoinbaseSubscription
-from server import handle_coinbase_event
+from app.models import User, CoinbaseSubscription, Subscription, PlanEnum
+from server import (
+    handle_coinbase_event,
+    _handle_subscription_created,
+    _handle_subscription_payment_succeeded,
+    _handle_subscription_cancelled,
+    _handle_subscription_updated,
+)
 
 
 def test_redirect_login_page(flask_client):
@@ -62,3 +72,139 @@ def test_handle_coinbase_event_extend_subscription(flask_client):
     assert user.is_premium()
 
     assert CoinbaseSubscription.get_by(user_id=user.id) is not None
+
+
+def _paddle_form(**kw) -> MultiDict:
+    form = dict(
+        cancel_url="https://checkout.paddle.com/subscription/cancel",
+        update_url="https://checkout.paddle.com/subscription/update",
+        subscription_id="1234",
+        next_bill_date="2021-01-01",
+        subscription_plan_id=str(PADDLE_MONTHLY_PRODUCT_ID),
+    )
+    form.update(kw)
+    return MultiDict(form)
+
+
+def test_paddle_subscription_created_new_sub(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    Session.commit()
+
+    form = _paddle_form(passthrough=f'{{"user_id": {user.id}}}')
+    assert _handle_subscription_created(form) == "OK"
+
+    sub = Subscription.get_by(user_id=user.id)
+    assert sub.subscription_id == "1234"
+    assert sub.plan == PlanEnum.monthly
+    assert sub.next_bill_date == arrow.get("2021-01-01").date()
+
+
+def test_paddle_subscription_created_existing_sub(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    Subscription.create(
+        user_id=user.id,
+        cancel_url="https://checkout.paddle.com/subscription/cancel",
+        update_url="https://checkout.paddle.com/subscription/update",
+        subscription_id="old",
+        event_time=arrow.now(),
+        next_bill_date=arrow.now().date(),
+        plan=PlanEnum.monthly,
+        cancelled=True,
+        commit=True,
+    )
+
+    form = _paddle_form(
+        passthrough=f'{{"user_id": {user.id}}}',
+        subscription_plan_id=str(PADDLE_YEARLY_PRODUCT_ID),
+    )
+    assert _handle_subscription_created(form) == "OK"
+
+    sub = Subscription.get_by(user_id=user.id)
+    assert sub.subscription_id == "1234"
+    assert sub.plan == PlanEnum.yearly
+    assert not sub.cancelled
+
+
+def test_paddle_subscription_created_unknown_plan(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    Session.commit()
+
+    form = _paddle_form(
+        passthrough=f'{{"user_id": {user.id}}}', subscription_plan_id="-2"
+    )
+    assert _handle_subscription_created(form) == ("No such subscription", 400)
+    assert Subscription.get_by(user_id=user.id) is None
+
+
+def test_paddle_handlers_no_sub(flask_client):
+    form = _paddle_form(subscription_id="not-exist")
+
+    # payment_succeeded can arrive before subscription_created
+    assert _handle_subscription_payment_succeeded(form) == "OK"
+    assert _handle_subscription_cancelled(form) == ("No such subscription", 400)
+    assert _handle_subscription_updated(form) == ("No such subscription", 400)
+
+
+def test_paddle_unknown_alert_name(flask_client, monkeypatch):
+    monkeypatch.setattr(paddle_utils, "verify_incoming_request", lambda form: True)
+
+    r = flask_client.post("/paddle", data={"alert_name": "unknown"})
+    assert r.status_code == 200
+    assert r.data == b"OK"
+
+
+def test_openid_metadata(flask_client):
+    r = flask_client.get("/.well-known/openid-configuration")
+    assert r.status_code == 200
+    assert r.json["jwks_uri"].endswith("/jwks")
+
+    r = flask_client.get("/jwks")
+    assert r.status_code == 200
+    assert len(r.json["keys"]) == 1
+
+
+def test_error_page(flask_client):
+    r = flask_client.get("/api/not-exist")
+    assert r.status_code == 404
+    assert r.json == {"error": "No such endpoint"}
+
+    r = flask_client.get("/not-exist")
+    assert r.status_code == 404
+    assert r.content_type.startswith("text/html")
+
+
+def test_oauth_path_alias(flask_client):
+    r = flask_client.get("/oauth2/userinfo")
+    assert r.status_code != 404
+
+    # /oauth is an alias of /oauth2
+    assert flask_client.get("/oauth/userinfo").status_code == r.status_code
+
+
+def test_openid_metadata_cors(flask_client):
+    for path in ["/.well-known/openid-configuration", "/jwks"]:
+        r = flask_client.get(path, headers={"Origin": "https://example.com"})
+        # with origins="*", flask-cors echoes the request Origin back
+        assert r.headers["Access-Control-Allow-Origin"] == "https://example.com"
+        # only the CORS extension sets the header
+        assert len(r.headers.getlist("Access-Control-Allow-Origin")) == 1
+
+
+def test_dt_filter_now_per_request(flask_app):
+    dt = flask_app.jinja_env.filters["dt"]
+
+    with flask_app.app_context():
+        with flask_app.test_request_context():
+            assert dt(arrow.now().shift(hours=-1)) == "an hour ago"
+            first_now = request.humanize_now
+
+        # a new request in the same app context gets a new "now"
+        with flask_app.test_request_context():
+            dt(arrow.now())
+            assert request.humanize_now is not first_now